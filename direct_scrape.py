@@ -6,8 +6,6 @@ from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from datetime import datetime
-from datetime import timedelta
 import requests
 from bs4 import BeautifulSoup
 from requests.auth import HTTPBasicAuth
@@ -19,6 +17,9 @@ import re
 import os
 import http.client
 from flatten_json import flatten
+from team_registry import TeamRegistry
+from timestamps import normalize_frame
+from odds_wal import open_log
 
 
 warnings.filterwarnings("ignore")
@@ -44,6 +45,7 @@ class Scraper(object):
         self.data = None
         self.data_dir_path = DATA_DIR_PATH + self.league + "\\" + self.sportsbook
         self.odds_by_month = None
+        self.wal = open_log(self.data_dir_path + "\\" + "odds.wal")
 
     def save_data(self):
         """
@@ -53,6 +55,33 @@ class Scraper(object):
         self.split_months()
         self.merge_with_existing_odds()
 
+    def add_event_ids(self, registry=None):
+        """
+        Adds canonical 'event_id', 'home_team' and 'away_team' columns so the
+        data can be merged with other books on 'event_id'
+
+        Args:
+            registry (TeamRegistry): registry to resolve with, loaded from disk if None
+        """
+        registry = registry or TeamRegistry()
+        home_col = 'home' if 'home' in self.data.columns else 'Home'
+        away_col = 'away' if 'away' in self.data.columns else 'Away'
+        self.data = registry.resolve_frame(
+            self.data, self.sportsbook, self.league, home_col, away_col)
+        registry.save()
+
+    def publish(self, board, registry=None):
+        """
+        Loads the scraped odds into a live OddsBoard
+
+        Args:
+            board (OddsBoard): board to update, books are keyed by book_key
+            registry (TeamRegistry): registry to resolve event ids with
+        """
+        if 'event_id' not in self.data.columns:
+            self.add_event_ids(registry)
+        board.update_frame(self.data, self.sportsbook, self.league)
+
     def split_months(self):
         g = self.data.groupby(pd.Grouper(key="date", freq="M"))
         self.odds_by_month = [group for _, group in g]
@@ -60,26 +89,23 @@ class Scraper(object):
     def merge_with_existing_odds(self):
         """
         Iterates through dataframes in self.odds_by_month and merges current
-        data with existing data prioritizing the most current lines
+        data with existing data prioritizing the most current lines.
+        Each month goes through the write-ahead log and is durable when this
+        returns, the .csv files are updated in the background.
         """
-        if not os.path.isdir(self.data_dir_path):
-            os.makedirs(self.data_dir_path)
+        home_col = 'home' if 'home' in self.data.columns else 'Home'
+        away_col = 'away' if 'away' in self.data.columns else 'Away'
         for m in self.odds_by_month:
             month = m['date'][0].strftime("%B")
             year = m['date'][0].year
             path = self.data_dir_path + "\\" + month + "_" + str(year) + ".csv"
             print(f"Saving {path}")
-            if not os.path.exists(path):
-                m.to_csv(path)
-            else:
-                df = pd.read_csv(path)
-                df = pd.concat([df, m], axis=0)
-                df = df[~df.index.duplicated(keep='last')]
-                df.to_csv(path)
+            self.wal.append(path, m, key=['date', home_col, away_col])
+        self.wal.wait()
 
 
 class BarstoolSportsbook(Scraper):
-    def __init__(self, league) -> None:
+    def __init__(self, league, board=None) -> None:
         super().__init__("Barstool", league)
         if league == "NBA":
             self.sport = "basketball"
@@ -114,15 +140,9 @@ class BarstoolSportsbook(Scraper):
         games = soup.find_all('div', class_="basic-event-row")
         data = []
         for game in games:
-            # get dates
+            # get dates, parsed for every game at once below
             date = game.find(
                 "p", class_="start-display strongbody2").text.strip()
-            if "Today" in date:
-                today = datetime.now().strftime("%a, %b %d,").strip()
-                date = date.split(',')[-1]
-                date = today + date
-            date = datetime.strptime(date, "%a, %b %d, %I:%M %p")
-            date = date.replace(year=datetime.now().year)
             # get teams
             participants = game.find("div", class_="row participant-row")
             participants = participants.find(
@@ -189,12 +209,15 @@ class BarstoolSportsbook(Scraper):
             }
 
             data.append(entry)
-        self.data = pd.DataFrame(data)
+        self.data = normalize_frame(pd.DataFrame(data), 'date', 'barstool')
+        self.add_event_ids()
         self.save_data()
+        if board is not None:
+            self.publish(board)
 
 
 class BetMGM(Scraper):
-    def __init__(self, league) -> None:
+    def __init__(self, league, board=None) -> None:
         super().__init__("BetMGM", league)
         if league == "NBA":
             self.sport = "basketball"
@@ -237,31 +260,11 @@ class BetMGM(Scraper):
             if is_live:
                 print("LIVE")
                 continue
-            # get dates
+            # get dates, parsed for every game at once below
             start = game.find("ms-event-timer", class_='grid-event-timer')
             if start is None:
                 continue
-            else:
-                start = start.text
-            if "Starting" in start:
-                mins_to_start = int(start.split(' ')[-2])
-                date = datetime.now() + timedelta(minutes=mins_to_start)
-            elif "Today" in start:
-                start = start.split()[-2:]
-                start = " ".join(start)
-                start = datetime.strptime(start, "%H:%M %p")
-                date = datetime.now()
-                date = date.replace(hour=start.hour, minute=start.minute)
-            elif "Tomorrow" in start:
-                start = start.split()[-2:]
-                start = " ".join(start)
-                start = datetime.strptime(start, "%I:%M %p")
-                date = datetime.now() + timedelta(days=1)
-                date = date.replace(hour=start.hour, minute=start.minute)
-            else:
-                start = re.sub("•", "", start)
-                date = datetime.strptime(start, "%m/%d/%y  %I:%M %p")
-            date = date.replace(second=0, microsecond=0)
+            date = start.text
         #     # get teams
             participants = game.find_all("div", class_="participant")
             # addresses any special matches or lines listed
@@ -325,14 +328,17 @@ class BetMGM(Scraper):
             }
 
             data.append(entry)
-        self.data = pd.DataFrame(data)
+        self.data = normalize_frame(pd.DataFrame(data), 'date', 'betmgm')
+        self.add_event_ids()
+        if board is not None:
+            self.publish(board)
         print(self.data.columns)
         # self.save_data()
 
 
 class BetRivers(Scraper):
 
-    def __init__(self, league) -> None:
+    def __init__(self, league, board=None) -> None:
         super().__init__("BetRivers", league)
         self.group_ids = {
             'NFL': 1000093656,
@@ -380,19 +386,20 @@ class BetRivers(Scraper):
         games = games.set_index('Game ID')
 
         df = pd.concat([games, teams, odds], axis=1)
-        df['start'] = pd.to_datetime(df['start'], utc=True)
+        df = normalize_frame(df, 'start', 'iso')
         df = df.reset_index().set_index('start')
-        df.index = df.index.tz_convert('US/Central')
-        df.index = df.index.tz_localize(None)
         df.index.name = 'date'
         self.data = df
+        self.add_event_ids()
+        if board is not None:
+            self.publish(board)
         # self.save_data()
         print(self.data)
 
 
 class DraftKings(Scraper):
 
-    def __init__(self, league) -> None:
+    def __init__(self, league, board=None) -> None:
         super().__init__("DraftKings", league)
         self.group_ids = {
             'NFL': 88808,
@@ -453,12 +460,13 @@ class DraftKings(Scraper):
         odds = odds.drop(columns=["ML Line Away", "ML Line Home"])
 
         df = games.merge(odds, how='outer', left_index=True, right_index=True)
-        df['startDate'] = pd.to_datetime(df['startDate'], utc=True)
+        df = normalize_frame(df, 'startDate', 'iso')
         df = df.reset_index().set_index('startDate')
-        df.index = df.index.tz_convert('US/Central')
-        df.index = df.index.tz_localize(None)
         df.index.name = 'date'
         self.data = df
+        self.add_event_ids()
+        if board is not None:
+            self.publish(board)
         print(self.data.sort_index())
 
 
@@ -0,0 +1,310 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from sportsbooks import book_key
+from team_registry import TeamRegistry
+
+# Columns each scraper uses for a market, first match wins
+MARKET_COLUMNS = {
+    'moneyline': {
+        'home': ['home moneyline'],
+        'away': ['away moneyline', 'away odds'],
+    },
+    'spread': {
+        'home line': ['home spread line'],
+        'home': ['home spread odds'],
+        'away line': ['away spread line'],
+        'away': ['away spread odds'],
+    },
+    'total': {
+        'over line': ['over line', 'tp over line'],
+        'over': ['over odds', 'tp over odds'],
+        'under line': ['under line', 'tp under line'],
+        'under': ['under odds', 'tp under odds'],
+    },
+}
+FIELDS = ('league', 'game', 'book', 'market')
+# Changes a subscriber may fall behind by before it is disconnected
+MAX_BACKLOG = 1000
+
+
+class OddsBoard(object):
+    """
+    In-memory board of the latest line for every (game, book, market),
+    fed by the scrapers and OddsLogger.
+
+    Quotes live in a single dict keyed by (league, game, book, market) with
+    a set index per field, so a query only touches the keys matching its
+    most selective filter. Subscribers get a queue that is pushed every
+    quote that changes and matches their filters. Books are stored under
+    their odds-api site key whichever feed quoted them. Every update marks a
+    quote as seen, so quotes for games that started or dropped out of their
+    feed can be cleared with expire, or a game removed with remove_game.
+    """
+
+    def __init__(self) -> None:
+        self.quotes = {}
+        self.index = {field: {} for field in FIELDS}
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def update(self, league, game, book, market, prices):
+        """
+        Stores a quote and notifies subscribers if it changed
+
+        Args:
+            league (str): league of the game
+            game (str): canonical event id of the game
+            book (str): book quoting the line, any spelling book_key understands
+            market (str): 'moneyline', 'spread' or 'total'
+            prices (dict): odds and lines for the market, e.g. {'home': -120, 'away': 110}
+        Returns:
+            True if the quote changed
+        """
+        book = book_key(book)
+        key = (league, game, book, market)
+        now = time.time()
+        with self.lock:
+            old = self.quotes.get(key)
+            if old is not None and old['prices'] == prices:
+                old['seen'] = now
+                return False
+            quote = {'league': league, 'game': game, 'book': book, 'market': market,
+                     'prices': prices, 'updated': now, 'seen': now}
+            self.quotes[key] = quote
+            if old is None:
+                for field, value in zip(FIELDS, key):
+                    self.index[field].setdefault(value, set()).add(key)
+            subscribers = list(self.subscribers)
+        for filters, q in subscribers:
+            if all(quote[f] == v for f, v in filters.items()):
+                try:
+                    q.put_nowait(quote)
+                except queue.Full:
+                    self.drop(q)
+        return True
+
+    def update_frame(self, df, book, league, registry=None):
+        """
+        Loads every market in a scraper's DataFrame into the board
+
+        Args:
+            df (DataFrame): odds from a single book
+            book (str): book the odds are from
+            league (str): league of the games
+            registry (TeamRegistry): used to add 'event_id' if df is missing it,
+                                     loaded from disk if None
+        """
+        if 'event_id' not in df.columns:
+            registry = registry or TeamRegistry()
+            home_col = 'home' if 'home' in df.columns else 'Home'
+            away_col = 'away' if 'away' in df.columns else 'Away'
+            df = registry.resolve_frame(df, book, league, home_col, away_col)
+            registry.save()
+        for market, fields in MARKET_COLUMNS.items():
+            columns = {}
+            for name, options in fields.items():
+                found = [c for c in options if c in df.columns]
+                if found:
+                    # Converted one column at a time so mixed dtypes don't
+                    # turn american odds into floats
+                    columns[name] = [to_json(x, odds='line' not in name) for x in df[found[0]]]
+            if not columns:
+                continue
+            for i, game in enumerate(df['event_id']):
+                prices = {name: values[i] for name, values in columns.items()}
+                if pd.isna(game) or all(x is None for x in prices.values()):
+                    continue
+                self.update(league, game, book, market, prices)
+
+    def query(self, **filters):
+        """
+        Returns the quotes matching every given filter, e.g. query(league="MLB", book="draftkings")
+        """
+        filters = {f: v for f, v in filters.items() if v is not None}
+        if 'book' in filters:
+            filters['book'] = book_key(filters['book'])
+        with self.lock:
+            if not filters:
+                return list(self.quotes.values())
+            keys = sorted((self.index[f].get(v, set()) for f, v in filters.items()), key=len)
+            keys = keys[0].intersection(*keys[1:])
+            return [self.quotes[k] for k in keys]
+
+    def remove_game(self, game):
+        """
+        Removes every quote for a game, e.g. once it has started
+        """
+        with self.lock:
+            self._remove(list(self.index['game'].get(game, ())))
+
+    def expire(self, max_age):
+        """
+        Removes quotes no feed has sent in the last max_age seconds, which
+        covers games that started or were taken down by their book
+        """
+        cutoff = time.time() - max_age
+        with self.lock:
+            self._remove([k for k, quote in self.quotes.items() if quote['seen'] < cutoff])
+
+    def _remove(self, keys):
+        for key in keys:
+            del self.quotes[key]
+            for field, value in zip(FIELDS, key):
+                values = self.index[field][value]
+                values.discard(key)
+                if not values:
+                    del self.index[field][value]
+
+    def subscribe(self, **filters):
+        """
+        Returns a queue that receives every future change matching the
+        filters. A subscriber more than MAX_BACKLOG changes behind is dropped
+        and receives None.
+        """
+        q = queue.Queue(maxsize=MAX_BACKLOG)
+        filters = {f: v for f, v in filters.items() if v is not None}
+        if 'book' in filters:
+            filters['book'] = book_key(filters['book'])
+        with self.lock:
+            self.subscribers.append((filters, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s[1] is not q]
+
+    def drop(self, q):
+        # Discard the backlog of a stalled subscriber so it gets the end marker
+        self.unsubscribe(q)
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        while True:
+            try:
+                q.put_nowait(None)
+                return
+            except queue.Full:
+                q.get_nowait()
+
+
+class OddsBoardServer(object):
+    """
+    Serves an OddsBoard over a local HTTP API from a background thread.
+
+    GET /odds?league=&game=&book=&market=       snapshot of matching quotes as json
+    GET /subscribe?league=&game=&book=&market=  server-sent event stream of changes
+
+    Args:
+        board (OddsBoard): board to serve
+        host (str): interface to bind, local only by default
+        port (int): port to listen on
+    """
+
+    def __init__(self, board, host="127.0.0.1", port=8765) -> None:
+        self.board = board
+        handler = type('Handler', (OddsBoardHandler,), {'board': board})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"Serving odds board on http://{self.server.server_address[0]}:{self.server.server_address[1]}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OddsBoardHandler(BaseHTTPRequestHandler):
+    board = None
+    heartbeat = 15
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        filters = {f: params[f][0] for f in FIELDS if f in params}
+        if url.path == "/odds":
+            self.send_json(self.board.query(**filters))
+        elif url.path == "/subscribe":
+            self.stream(filters)
+        else:
+            self.send_error(404)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, filters):
+        q = self.board.subscribe(**filters)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                try:
+                    quote = q.get(timeout=self.heartbeat)
+                    if quote is None:
+                        break
+                    self.wfile.write(f"data: {json.dumps(quote)}\n\n".encode())
+                except queue.Empty:
+                    # Comment line keeps proxies open and detects closed clients
+                    self.wfile.write(b": heartbeat\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.board.unsubscribe(q)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def to_json(x, odds=False):
+    """
+    Converts numpy values from a DataFrame to json friendly python values.
+    American odds are returned as ints, as OddsLogger quotes them, including
+    the '+110' strings DraftKings and BetRivers send.
+    """
+    if isinstance(x, np.generic):
+        x = x.item()
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return None
+    if odds and isinstance(x, str):
+        return int(x.replace('+', ''))
+    if odds and isinstance(x, float) and x.is_integer():
+        return int(x)
+    if isinstance(x, dt):
+        return x.isoformat()
+    return x
+
+
+if __name__ == '__main__':
+    from odds_logger import OddsLogger
+    from direct_scrape import BetRivers, DraftKings
+    board = OddsBoard()
+    OddsBoardServer(board).start()
+    while True:
+        OddsLogger("baseball_mlb", board=board)
+        BetRivers("MLB", board=board)
+        DraftKings("MLB", board=board)
+        # Anything not quoted for a few polls has started or been pulled
+        board.expire(max_age=300)
+        time.sleep(60)
@@ -5,8 +5,11 @@ import numpy as np
 from datetime import datetime as dt
 import os
 from dotenv import load_dotenv
-from sympy import symbols, Eq, solve
 from sportsbooks import SportsBooks
+from stake_optimizer import StakeOptimizer, format_allocation_msg
+from team_registry import TeamRegistry
+from timestamps import normalize, normalize_frame, to_local
+from odds_wal import open_log
 load_dotenv()
 
 DATA_DIR = "mlb_odds"
@@ -22,9 +25,17 @@ class OddsLogger(object):
 
     Args:
         sport (str): the sport to log the odds on the sportsbooks. Development to come
+        bankroll (float): dollars to allocate across any arbs found, defaults to
+                          the BANKROLL environment variable. Without either, odds
+                          are still logged but arb alerts are skipped
+        book_balances (dict): optional {site_key: dollars} available at each book
+        board (OddsBoard): optional live board to publish every book's line to
     """
 
-    def __init__(self, sport):
+    def __init__(self, sport, bankroll=None, book_balances=None, board=None):
+        self.bankroll = bankroll
+        self.book_balances = book_balances
+        self.wal = open_log(DATA_DIR_PATH + "\\" + "odds.wal")
         self.__api_key = os.getenv('API_KEY')
         base_url = "https://api.the-odds-api.com"
         odds_endpoint = f"/v3/odds/"
@@ -39,34 +50,32 @@ class OddsLogger(object):
         odds = json.loads(odds_req.text)
         odds = odds['data']
         self.games = []
-        no_arb = True
+        arb_legs = []
+        registry = TeamRegistry()
         for game in odds:
-            if dt.fromtimestamp(game['commence_time']) < dt.now():  # Ignore live odds
+            if game['commence_time'] < dt.now().timestamp():  # Ignore live odds
                 continue
             row = pd.Series()
             row["ID"] = game['id']
             row['Sport'] = game['sport_nice']
             row['Home'] = game['home_team']
             row['Away'] = [x for x in game['teams'] if x != game['home_team']][0]
-            row['Start Time'] = dt.fromtimestamp(game['commence_time'])
+            row['Start Time'] = game['commence_time']
             home_first = True if game['teams'][0] == game['home_team'] else False
             odds_by_sb = self.get_all_odds(
                 game['sites'], home_first=home_first, draw_possible=False)
             books_quoting = [s['site_key'] for s in game['sites']]
 
             if self.arb_exists(odds_by_sb):
-                # Calculate surebet
-                msg_dict = beat_bookies(row['Best Home Odds'], row['Home'], row['Best Book Home'],
-                                        row['Best Odds Away'], row['Away'], row['Best Book Away'])
-                alert = self.format_alert(msg_dict)
-                DiscordAlert(alert)
-                no_arb = False
+                # Stakes are sized together once every game has been seen
+                arb_legs += self.get_legs(row, books_quoting, odds_by_sb)
+
+            if board is not None:
+                self.publish(board, registry, row, books_quoting, odds_by_sb)
 
             for book in SportsBooks:
                 if book.name in books_quoting:
-                    last_update = dt.fromtimestamp(
-                        odds_by_sb[f"{book.name}_last_update"])
-                    row[f'{book.name}_last_update'] = last_update
+                    row[f'{book.name}_last_update'] = odds_by_sb[f"{book.name}_last_update"]
                     row[f"{book.name}_home"] = odds_by_sb[f"{book.name}_home"]
                     row[f"{book.name}_away"] = odds_by_sb[f"{book.name}_away"]
                 else:
@@ -74,9 +83,15 @@ class OddsLogger(object):
                     row[f"{book.name}_home"] = np.nan
                     row[f"{book.name}_away"] = np.nan
             self.games.append(row)
-        self.odds_frame = pd.DataFrame(self.games).set_index("ID")
+        # Quotes are logged before alerting so a failed alert loses nothing
+        self.odds_frame = self.normalize_times(pd.DataFrame(self.games).set_index("ID"))
+        self.odds_frame = registry.resolve_frame(
+            self.odds_frame, "oddsapi", "MLB", 'Home', 'Away', 'Start Time')
+        registry.save()
         self.odds_by_month = self.split_months()
         self.merge_with_existing_odds()
+        if arb_legs:
+            self.alert_arbs(pd.DataFrame(arb_legs))
 
     def get_all_odds(self, sites, home_first=True, draw_possible=False):
         '''
@@ -114,6 +129,54 @@ class OddsLogger(object):
                 odds[name + '_draw'] = line[-1]
         return odds
 
+    def get_legs(self, row, books_quoting, odds_by_sb):
+        """
+        Returns one leg per book and side of a game in the format expected
+        by StakeOptimizer.allocate
+        """
+        legs = []
+        for book in books_quoting:
+            legs.append({'Game': row['ID'], 'Team': row['Home'], 'Book': book,
+                         'Odds': odds_by_sb[book + '_home']})
+            legs.append({'Game': row['ID'], 'Team': row['Away'], 'Book': book,
+                         'Odds': odds_by_sb[book + '_away']})
+        return legs
+
+    def normalize_times(self, df):
+        """
+        Converts the unix 'Start Time' and last update columns to local time
+        in one batch, adding the UTC start as 'start_utc'
+        """
+        df = normalize_frame(df, 'Start Time', 'epoch')
+        for col in [c for c in df.columns if c.endswith('_last_update')]:
+            df[col] = to_local(normalize(df[col], 'epoch'))
+        return df
+
+    def publish(self, board, registry, row, books_quoting, odds_by_sb):
+        """
+        Pushes the moneyline from every book quoting a game to the OddsBoard
+        """
+        start = to_local(normalize([row['Start Time']], 'epoch'))[0]
+        for book in books_quoting:
+            event_id = registry.resolve_event(
+                book, "MLB", row['Home'], row['Away'], start)
+            board.update("MLB", event_id, book, 'moneyline',
+                         {'home': odds_by_sb[book + '_home'], 'away': odds_by_sb[book + '_away']})
+
+    def alert_arbs(self, legs):
+        """
+        Sizes the stakes for every arb found this run against the bankroll
+        and sends them in a single DiscordAlert
+        """
+        bankroll = self.bankroll if self.bankroll is not None else os.getenv('BANKROLL')
+        if bankroll is None:
+            print("Arb found but no bankroll or BANKROLL set, skipping alert")
+            return
+        bankroll = float(bankroll)
+        optimizer = StakeOptimizer(bankroll, book_balances=self.book_balances, hedged=True)
+        allocation = optimizer.allocate(legs)
+        DiscordAlert(format_allocation_msg(allocation, bankroll))
+
     def split_months(self):
         g = self.odds_frame.groupby(pd.Grouper(key="Start Time", freq="M"))
         return [group for _, group in g]
@@ -121,22 +184,17 @@ class OddsLogger(object):
     def merge_with_existing_odds(self):
         """
         Iterates through dataframes in self.odds_by_month and merges current
-        data with existing data prioritizing the most current lines
+        data with existing data prioritizing the most current lines.
+        Each month goes through the write-ahead log and is durable when this
+        returns, the .csv files are updated in the background.
         """
-        if not os.path.isdir(DATA_DIR_PATH):
-            os.makedirs(DATA_DIR_PATH)
         for m in self.odds_by_month:
             month = m['Start Time'][0].strftime("%B")
             year = m['Start Time'][0].year
             path = DATA_DIR_PATH + "\\" + month + "_" + str(year) + ".csv"
             print(f"Saving {path}")
-            if not os.path.exists(path):
-                m.to_csv(path)
-            else:
-                df = pd.read_csv(path, index_col="ID")
-                df = pd.concat([df, m], axis=0)
-                df = df[~df.index.duplicated(keep='last')]
-                df.to_csv(path)
+            self.wal.append(path, m, key=["ID"])
+        self.wal.wait()
 
     def arb_exists(self, odds_by_sb):
         sure_bet = 0
@@ -150,19 +208,6 @@ class OddsLogger(object):
         else:
             return False
 
-    def format_msg(self, msg_dict):
-        """
-        Formats Message to be passed to DiscordAlert for notification
-        Args:
-            msg_dict (dict): Dictionary from beat_bookies
-        """
-        heading = "ALERT: Arb Spotted! ACT FAST" + "\n"
-        intro = f"For a total stake of {msg_dict['Total Stake']} place the following bets: \n \n"
-        bets = f"{msg_dict['Home Book']}: {msg_dict['Home Team']} ML at {msg_dict['Home Odds']} for {msg_dict['Home Stake']} \n" + \
-            f"{msg_dict['Away Book']}: {msg_dict['Away Team']} ML at {msg_dict['Away Odds']} for {msg_dict['Away Stake']} \n"
-        profit = f"This will result in a profit of {msg_dict['Home Profit']} or {msg_dict['Away Profit']}"
-        return heading + intro + bets + profit
-
 
 def decimal_odds(odds: int) -> float:
     """
@@ -181,21 +226,6 @@ def decimal_odds(odds: int) -> float:
             return float(odds)
 
 
-def beat_bookies(home_odds, home_team, home_book, away_odds, away_team, away_book, total_stake):
-    x, y = symbols('x y')
-    eq1 = Eq(x + y - total_stake, 0)  # total_stake = x + y
-    eq2 = Eq((away_odds*y) - home_odds*x, 0)  # odds1*x = odds2*y
-    stakes = solve((eq1, eq2), (x, y))
-    total_investment = stakes[x] + stakes[y]
-    profit1 = home_odds*stakes[x] - total_stake
-    profit2 = away_odds*stakes[y] - total_stake
-    benefit1 = f'{profit1 / total_investment * 100:.2f}%'
-    benefit2 = f'{profit2 / total_investment * 100:.2f}%'
-    dict_gabmling = {'Home Odds': home_odds, 'Away Odds': away_odds, 'Home Stake': f'${stakes[x]:.0f}', 'Away Stake': f'${stakes[y]:.0f}', 'Home Profit': f'${profit1:.2f}', 'Away Profit': f'${profit2:.2f}',
-                     'Benefit1': benefit1, 'Benefit2': benefit2, "Home Book": home_book, "Home Team": home_team, 'Away Book': away_book, 'Away Team': away_team, "Total Stake": total_stake}
-    return dict_gabmling
-
-
 class DiscordAlert(object):
     """
     Class to send a message to my discord bot
@@ -0,0 +1,240 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import zlib
+from io import StringIO
+
+import pandas as pd
+
+# Process wide logs, one per data directory, see open_log
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+class WriteAheadLog(object):
+    """
+    Crash-safe ingestion for the monthly odds files.
+
+    Every snapshot is appended to a log file before it is merged into its
+    .csv. A background thread writes and fsyncs whatever has been appended
+    since its last fsync in one go (group commit), so durability costs one
+    fsync per batch instead of one per snapshot. A second thread merges
+    durable snapshots into the .csv files, each replaced atomically, and the
+    log is truncated once everything in it has been applied. Merging keeps
+    the last row per game key, so replaying an applied snapshot is harmless.
+
+    Use open_log rather than creating one directly: it keeps a single log
+    per data directory open for the life of the process, so writers share
+    the group commit and the applier, snapshots left by a crashed run are
+    replayed the first time the directory is written to, and every log is
+    closed, draining what is left to the .csv files, at exit.
+
+    Args:
+        path (str): log file, created if missing
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.replay()
+
+        self.cond = threading.Condition()
+        self.buffer = []
+        self.appended_seq = 0
+        self.durable_seq = 0
+        self.applied_seq = 0
+        self.truncated_seq = 0
+        self.closing = False
+        self.error = None
+        self.to_apply = queue.Queue()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.applier = threading.Thread(target=self.apply_loop, daemon=True)
+        self.flusher.start()
+        self.applier.start()
+
+    def append(self, path, frame, key):
+        """
+        Logs a snapshot to be merged into the .csv at path
+
+        Args:
+            path (str): .csv the snapshot belongs to
+            frame (DataFrame): rows to merge, replacing existing rows for the same game
+            key (list): columns, or index name, identifying a game, e.g. ['date', 'home', 'away']
+        Returns:
+            sequence number of the snapshot, pass to wait() to block until it is durable
+        """
+        record = {'path': path, 'key': list(key), 'csv': frame.to_csv()}
+        payload = json.dumps(record)
+        line = f"{zlib.crc32(payload.encode()):08x} {payload}\n"
+        with self.cond:
+            self.raise_error()
+            if self.closing:
+                raise RuntimeError(f"Write-ahead log {self.path} is closed")
+            self.appended_seq += 1
+            self.buffer.append((self.appended_seq, record, line))
+            self.cond.notify_all()
+            return self.appended_seq
+
+    def wait(self, seq=None):
+        """
+        Blocks until snapshot seq, or everything appended so far, is fsynced
+        """
+        with self.cond:
+            seq = self.appended_seq if seq is None else seq
+            self.cond.wait_for(lambda: self.durable_seq >= seq or self.error)
+            self.raise_error()
+
+    def close(self):
+        """
+        Blocks until every snapshot is applied to its .csv, then truncates the log
+        """
+        with self.cond:
+            if self.closing:
+                return
+            self.cond.wait_for(lambda: self.applied_seq >= self.appended_seq or self.error)
+            self.closing = True
+            self.cond.notify_all()
+        self.flusher.join()
+        self.to_apply.put(None)
+        self.applier.join()
+        self.file.close()
+        self.raise_error()
+
+    def flush_loop(self):
+        # Only this thread touches the log file, so writes stay in sequence order
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.buffer or self.closing or self.idle())
+                    batch, self.buffer = self.buffer, []
+                    truncate = not batch and self.idle()
+                    if not batch and not truncate:
+                        break
+                if truncate:
+                    self.file.truncate(0)
+                    with self.cond:
+                        self.truncated_seq = self.applied_seq
+                        if self.closing:
+                            break
+                    continue
+                self.file.write("".join(line for _, _, line in batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                with self.cond:
+                    self.durable_seq = batch[-1][0]
+                    self.cond.notify_all()
+                for seq, record, _ in batch:
+                    self.to_apply.put((seq, record))
+        except Exception as e:
+            self.fail(e)
+
+    def apply_loop(self):
+        # Drains everything durable so far and rewrites each .csv once per batch
+        try:
+            done = False
+            while not done:
+                batch = [self.to_apply.get()]
+                while not self.to_apply.empty():
+                    batch.append(self.to_apply.get())
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+                if not batch:
+                    continue
+                apply_records([record for _, record in batch])
+                with self.cond:
+                    self.applied_seq = batch[-1][0]
+                    self.cond.notify_all()
+        except Exception as e:
+            self.fail(e)
+
+    def idle(self):
+        # Everything appended has been applied and the log still holds it
+        return (self.applied_seq == self.appended_seq
+                and self.applied_seq > self.truncated_seq)
+
+    def fail(self, e):
+        with self.cond:
+            self.error = e
+            self.cond.notify_all()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Write-ahead log {self.path} failed") from self.error
+
+    def replay(self):
+        """
+        Applies every intact snapshot left in the log by a previous run, then
+        truncates it. Reading stops at the first torn or corrupt line.
+        """
+        if not os.path.exists(self.path):
+            return
+        records = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                crc, _, payload = line.rstrip("\n").partition(" ")
+                if not line.endswith("\n") or f"{zlib.crc32(payload.encode()):08x}" != crc:
+                    print(f"Discarding torn record in {self.path}")
+                    break
+                records.append(json.loads(payload))
+        if records:
+            apply_records(records)
+            print(f"Replayed {len(records)} snapshots from {self.path}")
+        open(self.path, 'w').close()
+
+
+def open_log(path):
+    """
+    Returns the process wide WriteAheadLog at path, opening it and replaying
+    anything a crashed run left in it on first use
+    """
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = WriteAheadLog(path)
+        return _logs[path]
+
+
+@atexit.register
+def close_logs():
+    """
+    Applies everything still in the open logs and truncates them
+    """
+    with _logs_lock:
+        logs = list(_logs.values())
+        _logs.clear()
+    for wal in logs:
+        wal.close()
+
+
+def apply_records(records):
+    """
+    Merges logged snapshots into their .csv files in order, keeping the most
+    recent row for each game key
+    """
+    by_path = {}
+    for record in records:
+        by_path.setdefault(record['path'], []).append(record)
+    for path, snapshots in by_path.items():
+        frames = [pd.read_csv(StringIO(r['csv']), index_col=0) for r in snapshots]
+        if os.path.exists(path):
+            frames.insert(0, pd.read_csv(path, index_col=0))
+        df = pd.concat(frames, axis=0)
+        # Positional indexes like Barstool's restart every scrape, so rows
+        # are matched on the key columns rather than the index
+        key = snapshots[-1]['key']
+        df = df[~df.reset_index()[key].duplicated(keep='last').to_numpy()]
+        if df.index.name is None:
+            df = df.reset_index(drop=True)
+        # Written to a temporary file and swapped in so a crash never leaves
+        # a partially rewritten month
+        tmp = path + ".tmp"
+        with open(tmp, 'w', newline='') as f:
+            df.to_csv(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
@@ -22,3 +22,15 @@ class SportsBooks(Enum):
     unibet = "unibet"
     williamhill = "williamhill_us"
     wynnbet = "wynnbet"
+
+
+def book_key(name):
+    """
+    Returns the odds-api site key for a book name as written by a scraper,
+    e.g. "DraftKings" -> "draftkings", so every feed quotes a book under one key
+    """
+    key = "".join(c for c in str(name).lower() if c.isalnum())
+    for book in SportsBooks:
+        if key in (book.value, book.name):
+            return book.value
+    return key
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.sparse import csr_matrix, vstack
+
+
+class StakeOptimizer(object):
+    """
+    Allocates one bankroll across every open opportunity at once by
+    maximizing fractional-Kelly expected log growth, subject to the total
+    bankroll, per-book balances and a per-bet cap.
+
+    Each game is treated as independent, so the objective is the sum over
+    games of sum_o p_o * log(1 + R_o / kelly_fraction), where R_o is the
+    return (as a fraction of bankroll) if outcome o wins. Unconstrained this
+    gives kelly_fraction times the full Kelly stakes, and arbs come out as
+    hedged positions on every outcome of the game.
+
+    Args:
+        bankroll (float): total dollars available to bet
+        kelly_fraction (float): fraction of full Kelly to bet (0, 1]
+        book_balances (dict): optional {book: dollars} available at each book,
+                              books not listed are only limited by the bankroll
+        max_stake (float): optional cap in dollars on any single bet
+        max_exposure (float): fraction of the bankroll that may be staked in total
+        hedged (bool): if True every game is staked as an arb, so no outcome
+                       pays back less than was staked on that game
+        max_iter (int): maximum number of outer solver iterations
+        tol (float): allowed budget violation, as a fraction of bankroll
+    """
+
+    def __init__(self, bankroll, kelly_fraction=0.25, book_balances=None,
+                 max_stake=None, max_exposure=1.0, hedged=False, max_iter=50,
+                 tol=1e-6) -> None:
+        if bankroll <= 0:
+            raise ValueError("bankroll must be positive")
+        if not 0 < kelly_fraction <= 1:
+            raise ValueError("kelly_fraction must be in (0, 1]")
+        self.bankroll = bankroll
+        self.kelly_fraction = kelly_fraction
+        self.book_balances = book_balances or {}
+        self.max_stake = max_stake
+        self.max_exposure = max_exposure
+        self.hedged = hedged
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def allocate(self, legs):
+        """
+        Solves for the stake on every leg.
+
+        Args:
+            legs (DataFrame): one row per quoted line with columns
+                'Game' (game id), 'Team' (outcome), 'Book' and 'Odds' (american).
+                An optional 'Prob' column gives the win probability of the
+                outcome, otherwise the no-vig consensus of the books is used.
+        Returns:
+            copy of legs with 'Decimal Odds', 'Prob' and 'Stake' (dollars) columns
+        """
+        legs = legs.reset_index(drop=True).copy()
+        legs['Decimal Odds'] = american_to_decimal(legs['Odds'].to_numpy())
+        if 'Prob' not in legs.columns:
+            legs['Prob'] = fair_probabilities(legs)
+        legs['Stake'] = 0.0
+
+        # Only games with at least one +EV leg can receive a stake, keeping
+        # the problem small when most of the board is priced efficiently
+        edge = legs['Prob'] * legs['Decimal Odds'] > 1
+        active = legs['Game'].isin(legs.loc[edge, 'Game'])
+        if not active.any():
+            return legs
+        stakes = self._solve(legs[active])
+        legs.loc[active, 'Stake'] = np.round(stakes * self.bankroll, 2)
+        return legs
+
+    def _solve(self, legs):
+        game = legs.groupby('Game', sort=False).ngroup().to_numpy()
+        outcome = legs.groupby(['Game', 'Team'], sort=False).ngroup().to_numpy()
+        n_games = game.max() + 1
+        n_outcomes = outcome.max() + 1
+        d = legs['Decimal Odds'].to_numpy(dtype=float)
+        c = self.kelly_fraction
+
+        # Probability and game of every outcome, normalized within the game
+        p = np.zeros(n_outcomes)
+        p[outcome] = legs['Prob'].to_numpy(dtype=float)
+        outcome_game = np.zeros(n_outcomes, dtype=int)
+        outcome_game[outcome] = game
+        p = p / np.bincount(outcome_game, p, n_games)[outcome_game]
+
+        def wealth(s):
+            staked = np.bincount(game, s, n_games)[outcome_game]
+            payout = np.bincount(outcome, s * d, n_outcomes)
+            return np.maximum(1 + (payout - staked) / c, 1e-12)
+
+        def neg_growth(s):
+            return -np.sum(p * np.log(wealth(s)))
+
+        def neg_gradient(s):
+            q = p / wealth(s)
+            q_game = np.bincount(outcome_game, q, n_games)
+            return -(q[outcome] * d - q_game[game]) / c
+
+        n = len(d)
+        cap = None if self.max_stake is None else self.max_stake / self.bankroll
+        rows = [np.ones(n)]
+        limits = [self.max_exposure]
+        books = legs['Book'].to_numpy()
+        for book, balance in self.book_balances.items():
+            in_book = books == book
+            if in_book.any():
+                rows.append(in_book.astype(float))
+                limits.append(balance / self.bankroll)
+        A = csr_matrix(np.vstack(rows))
+        b = np.array(limits)
+        if self.hedged:
+            A_hedge, b_hedge = self._hedge_rows(game, outcome, d)
+            A = vstack([A, A_hedge]).tocsr()
+            b = np.concatenate([b, b_hedge])
+
+        # Augmented Lagrangian on the few budget rows, leaving only simple
+        # bounds for L-BFGS-B so the solve stays fast with thousands of legs
+        lam = np.zeros(len(b))
+        rho = 10.0
+        s = np.zeros(n)
+        for _ in range(self.max_iter):
+            def objective(s):
+                v = np.maximum(0, lam + rho * (A @ s - b))
+                value = neg_growth(s) + (v @ v - lam @ lam) / (2 * rho)
+                return value, neg_gradient(s) + A.T @ v
+            result = minimize(objective, s, jac=True, method='L-BFGS-B',
+                              bounds=[(0, cap)] * n)
+            s = result.x
+            lam = np.maximum(0, lam + rho * (A @ s - b))
+            if np.max(A @ s - b) < self.tol:
+                break
+            rho *= 2
+        return s
+
+    def _hedge_rows(self, game, outcome, d):
+        """
+        Rows of staked(game) - payout(outcome) <= -margin for every outcome,
+        with a margin that covers rounding each stake to the cent
+        """
+        legs = pd.DataFrame({'game': game, 'outcome': outcome, 'd': d,
+                             'leg': np.arange(len(d))})
+        outcomes = legs[['game', 'outcome']].drop_duplicates().sort_values('outcome')
+        pairs = outcomes.merge(legs, on='game', suffixes=('', '_leg'))
+        coef = 1 - np.where(pairs['outcome'] == pairs['outcome_leg'], pairs['d'], 0)
+        A = csr_matrix((coef, (pairs['outcome'], pairs['leg'])),
+                       shape=(len(outcomes), len(d)))
+        per_game = legs.groupby('game')['d'].agg(['size', 'max'])
+        margin = 0.005 * per_game['size'] * per_game['max'] / self.bankroll + self.tol
+        return A, -margin.loc[outcomes['game']].to_numpy()
+
+
+def american_to_decimal(odds):
+    """
+    Vectorized version of decimal_odds for an array of american odds
+    """
+    odds = np.asarray(odds, dtype=float)
+    return np.where(odds >= 100, 1 + odds / 100, 1 + 100 / np.abs(odds))
+
+
+def fair_probabilities(legs):
+    """
+    Estimates the win probability of each leg's outcome as the average
+    implied probability across books, with the vig removed within each game
+
+    Args:
+        legs (DataFrame): must contain 'Game', 'Team' and 'Decimal Odds'
+    """
+    implied = 1 / legs['Decimal Odds']
+    by_outcome = implied.groupby([legs['Game'], legs['Team']]).transform('mean')
+    outcomes = pd.DataFrame({'Game': legs['Game'], 'Team': legs['Team'],
+                             'p': by_outcome}).drop_duplicates(['Game', 'Team'])
+    overround = outcomes.groupby('Game')['p'].sum()
+    return by_outcome / legs['Game'].map(overround)
+
+
+def format_allocation_msg(allocation, bankroll):
+    """
+    Formats the bets from StakeOptimizer.allocate to be passed to DiscordAlert
+
+    Args:
+        allocation (DataFrame): output of StakeOptimizer.allocate
+        bankroll (float): bankroll the allocation was solved for
+    """
+    bets = allocation[allocation['Stake'] >= 1]
+    heading = "ALERT: Bets Spotted! ACT FAST" + "\n"
+    intro = f"With a bankroll of ${bankroll:.2f} place the following bets " + \
+        f"(${bets['Stake'].sum():.2f} total): \n \n"
+    lines = ""
+    for _, bet in bets.iterrows():
+        lines += f"{bet['Book']}: {bet['Team']} ML at {bet['Odds']} for ${bet['Stake']:.2f} \n"
+    return heading + intro + lines
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+from datetime import timedelta
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+REGISTRY_PATH = os.path.dirname(__file__) + "\\" + "team_registry.json"
+
+
+class TeamRegistry(object):
+    """
+    Canonical team and event registry shared by every scraper so that odds
+    from different books for the same game can be joined on an event ID.
+
+    Raw team strings are resolved once, by exact alias lookup or fuzzy match
+    within the league, and the result is learned as a new alias. A game is
+    identified by its league, canonical teams and date; books that quote it
+    within tolerance of a known start share that game's event ID, so double
+    headers stay apart without splitting games the books time differently.
+    Events are cached by (book, raw name, start time) so repeated lookups on
+    later runs are a single dict access.
+
+    Args:
+        path (str): json file the registry is loaded from and saved to
+        cutoff (float): minimum similarity in [0, 1] for a fuzzy match,
+                        names below it are registered as a new team
+        tolerance (timedelta): largest difference in start time between
+                               books quoting the same game
+    """
+
+    def __init__(self, path=REGISTRY_PATH, cutoff=0.6, tolerance=timedelta(hours=2)) -> None:
+        self.path = path
+        self.cutoff = cutoff
+        self.tolerance = tolerance
+        self.teams = {}    # league -> {canonical name: [aliases]}
+        self.aliases = {}  # (league, normalized alias) -> canonical name
+        self.games = {}    # (league, away, home, date) -> [(start, event id)]
+        self.events = {}   # (book, raw name, start) -> event id
+        if os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError:
+            print(f"Could not read {self.path}, starting an empty registry")
+            return
+        for league, teams in data.get('teams', {}).items():
+            for canonical, aliases in teams.items():
+                self.register_team(league, canonical, aliases)
+        for key, starts in data.get('games', {}).items():
+            self.games[tuple(key.split("|"))] = [(pd.Timestamp(start), event_id)
+                                                 for start, event_id in starts]
+        for key, event_id in data.get('events', {}).items():
+            book, raw, start = key.split("|")
+            self.events[(book, raw, start)] = event_id
+
+    def save(self):
+        """
+        Writes the registry to disk, dropping games and events from before
+        yesterday so the file does not grow with every run
+        """
+        cutoff = pd.Timestamp.now().normalize() - timedelta(days=1)
+        self.games = {key: starts for key, starts in self.games.items()
+                      if pd.Timestamp(key[3]) >= cutoff}
+        self.events = {key: event_id for key, event_id in self.events.items()
+                       if pd.Timestamp(key[2]).tz_localize(None) >= cutoff}
+        data = {
+            'teams': self.teams,
+            'games': {"|".join(key): [(start.isoformat(), event_id) for start, event_id in starts]
+                      for key, starts in self.games.items()},
+            'events': {"|".join(key): event_id for key, event_id in self.events.items()}
+        }
+        # Written to a temporary file and swapped in so a crash never leaves
+        # truncated json behind
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def register_team(self, league, canonical, aliases=()):
+        """
+        Adds a canonical team and any known aliases for it
+        """
+        known = self.teams.setdefault(league, {}).setdefault(canonical, [])
+        for alias in [canonical, *aliases]:
+            self.aliases[(league, normalize_name(alias))] = canonical
+            if alias != canonical and alias not in known:
+                known.append(alias)
+
+    def resolve_team(self, league, raw):
+        """
+        Returns the canonical name for a raw team string, learning it as an
+        alias of the closest team in the league or as a new team
+
+        Args:
+            league (str): league the team plays in, e.g. "MLB"
+            raw (str): team name as quoted by a book
+        """
+        name = normalize_name(raw)
+        canonical = self.aliases.get((league, name))
+        if canonical is not None:
+            return canonical
+
+        best, best_score = None, 0
+        for team in self.teams.get(league, {}):
+            score = team_similarity(name, normalize_name(team))
+            if score > best_score:
+                best, best_score = team, score
+        raw = str(raw).strip()
+        canonical = best if best_score >= self.cutoff else raw
+        self.register_team(league, canonical, [raw])
+        return canonical
+
+    def resolve_event(self, book, league, home, away, start):
+        """
+        Returns the canonical event ID for a game quoted by a book, or None
+        if a team or the start time is missing
+
+        Args:
+            book (str): book quoting the game
+            league (str): league of the game
+            home (str): raw home team name
+            away (str): raw away team name
+            start (datetime): scheduled start time
+        """
+        if pd.isna(home) or pd.isna(away) or pd.isna(start):
+            return None
+        start = pd.Timestamp(start)
+        event_id = self.events.get((book, home, start.isoformat()))
+        if event_id is not None:
+            return event_id
+
+        home_team = self.resolve_team(league, home)
+        away_team = self.resolve_team(league, away)
+        event_id = self.match_game(league, away_team, home_team, start)
+        self.events[(book, home, start.isoformat())] = event_id
+        self.events[(book, away, start.isoformat())] = event_id
+        return event_id
+
+    def match_game(self, league, away_team, home_team, start):
+        """
+        Returns the event ID of the known game between the teams nearest to
+        start within tolerance, registering a new game if there is none
+        """
+        dates = {(start - self.tolerance).date(), start.date(), (start + self.tolerance).date()}
+        known = [game for date in dates
+                 for game in self.games.get((league, away_team, home_team, str(date)), [])]
+        if known:
+            nearest, event_id = min(known, key=lambda game: abs(game[0] - start))
+            if abs(nearest - start) <= self.tolerance:
+                return event_id
+
+        same_day = self.games.setdefault((league, away_team, home_team, str(start.date())), [])
+        event_id = f"{league}_{start.strftime('%Y%m%d')}_{slug(away_team)}@{slug(home_team)}"
+        if same_day:
+            # Second game of a double header
+            event_id += f"_{len(same_day) + 1}"
+        same_day.append((start, event_id))
+        return event_id
+
+    def resolve_frame(self, df, book, league, home_col='home', away_col='away', date_col='date'):
+        """
+        Adds canonical 'event_id', 'home_team' and 'away_team' columns to a
+        scraper's DataFrame so books can be merged on 'event_id'
+
+        Args:
+            df (DataFrame): odds from a single book
+            book (str): book the odds are from
+            league (str): league of the games
+            home_col, away_col (str): columns holding the raw team names
+            date_col (str): column, or index name, holding the start time
+
+        Rows missing a team or start time are kept with empty columns.
+        """
+        df = df.copy()
+        dates = df[date_col] if date_col in df.columns else df.index.to_series(index=df.index)
+        df['event_id'] = [self.resolve_event(book, league, h, a, d)
+                          for h, a, d in zip(df[home_col], df[away_col], dates)]
+        df['home_team'] = [self.aliases.get((league, normalize_name(x))) if pd.notna(x) else None
+                           for x in df[home_col]]
+        df['away_team'] = [self.aliases.get((league, normalize_name(x))) if pd.notna(x) else None
+                           for x in df[away_col]]
+        return df
+
+
+def normalize_name(name):
+    """
+    Lowercases a team name and strips punctuation and the rotation numbers
+    books put before or after it, keeping digits inside names like 76ers
+    """
+    name = re.sub(r"[^a-z0-9 ]", " ", str(name).lower())
+    name = re.sub(r"^(\d+ )+|( \d+)+$", "", " ".join(name.split()))
+    return name
+
+
+def team_similarity(a, b):
+    """
+    Similarity of two normalized team names. Books abbreviate the city
+    ("LA Dodgers") but not the nickname, so names with different nicknames
+    never match, which keeps the Mets from being learned as the Yankees
+    """
+    if a.split()[-1:] != b.split()[-1:]:
+        return 0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def slug(name):
+    return normalize_name(name).replace(" ", "_")
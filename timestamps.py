@@ -0,0 +1,167 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# Books display start times, and the odds files are stored, in this timezone
+LOCAL_TZ = "US/Central"
+# Missing times, same sentinel pandas uses for NaT
+NAT = np.iinfo(np.int64).min
+
+
+def normalize(values, source, now=None, tz=LOCAL_TZ):
+    """
+    Parses start times from any source into UTC nanoseconds since the epoch.
+
+    Each distinct string is parsed once and the batch is parsed with a single
+    format per source, so whole history files normalize in one pass.
+
+    Args:
+        values (array-like): raw start times
+        source (str): one of
+            'epoch'    - unix seconds (odds-api commence_time, last_update)
+            'iso'      - ISO 8601 strings with an offset (BetRivers, DraftKings)
+            'local'    - naive datetimes in tz (stored odds files)
+            'barstool' - "Today, 7:05 PM" / "Sat, Jul 02, 7:05 PM"
+            'betmgm'   - "Starting in 12 min" / "Today • 7:05 PM" /
+                         "Tomorrow • 7:05 PM" / "7/4/22 • 1:10 PM"
+        now (Timestamp): reference time for relative strings, defaults to now
+        tz (str): timezone of naive and displayed times
+    Returns:
+        np.ndarray of int64, NAT where a value could not be parsed
+    """
+    parsers = {
+        'epoch': parse_epoch,
+        'iso': parse_iso,
+        'local': parse_local,
+        'barstool': parse_barstool,
+        'betmgm': parse_betmgm,
+    }
+    if source not in parsers:
+        raise ValueError(f"Unknown timestamp source {source}")
+    now = pd.Timestamp.now(tz=tz) if now is None else pd.Timestamp(now)
+    if now.tz is None:
+        now = now.tz_localize(tz)
+    now = now.tz_convert(tz)
+
+    codes, uniques = pd.factorize(pd.Series(values))
+    if len(uniques) == 0:
+        return np.full(len(codes), NAT, dtype=np.int64)
+    parsed = parsers[source](pd.Series(uniques), now, tz)
+    parsed = pd.DatetimeIndex(parsed).tz_convert("UTC").astype("datetime64[ns, UTC]")
+    parsed = np.append(parsed.asi8, NAT)  # code -1 picks the trailing NAT
+    return parsed[codes]
+
+
+def to_local(utc_ns, tz=LOCAL_TZ):
+    """
+    Converts UTC nanoseconds back to the naive local datetimes stored in the odds files
+    """
+    return pd.to_datetime(np.asarray(utc_ns, dtype=np.int64), utc=True).tz_convert(tz).tz_localize(None)
+
+
+def normalize_frame(df, column, source, now=None, tz=LOCAL_TZ):
+    """
+    Adds a 'start_utc' int64 column to df from the start times in column
+    (or the index, if column is the index name) and rewrites column as
+    naive local time
+    """
+    df = df.copy()
+    on_index = column not in df.columns
+    raw = df.index if on_index else df[column]
+    utc = normalize(raw, source, now, tz)
+    df['start_utc'] = utc
+    if on_index:
+        df.index = to_local(utc, tz).rename(column)
+    else:
+        df[column] = to_local(utc, tz)
+    return df
+
+
+def parse_epoch(values, now, tz):
+    return pd.to_datetime(pd.to_numeric(values, errors='coerce'), unit='s', utc=True)
+
+
+def parse_iso(values, now, tz):
+    return pd.to_datetime(values, utc=True, errors='coerce')
+
+
+def parse_local(values, now, tz):
+    return localize(pd.to_datetime(values, errors='coerce'), tz)
+
+
+def parse_barstool(values, now, tz):
+    values = values.astype(str).str.strip()
+    values = values.str.replace("Today", now.strftime("%a, %b %d"), regex=False)
+    values = values.str.replace(
+        "Tomorrow", (now + timedelta(days=1)).strftime("%a, %b %d"), regex=False)
+    # The weekday is redundant and would not match a guessed year
+    values = values.str.replace(r"^[A-Za-z]{3}, ", "", regex=True)
+    return localize(closest_year(values, "%b %d, %I:%M %p", now), tz)
+
+
+def parse_betmgm(values, now, tz):
+    values = values.astype(str).str.replace("•", " ", regex=False)
+    values = values.str.split().str.join(" ")
+    time_of_day = values.str.extract(r"(\d{1,2}:\d{2} ?[AP]M)", expand=False)
+    day = values.str.extract(r"(\d{1,2}/\d{1,2}/\d{2})", expand=False)
+    day = day.mask(values.str.contains("Today"), now.strftime("%m/%d/%y"))
+    day = day.mask(values.str.contains("Tomorrow"),
+                   (now + timedelta(days=1)).strftime("%m/%d/%y"))
+    parsed = localize(pd.to_datetime(day + " " + time_of_day.str.replace(" ", ""),
+                                     format="%m/%d/%y %I:%M%p", errors='coerce'), tz)
+
+    minutes = pd.to_numeric(values.str.extract(r"Starting in (\d+)", expand=False), errors='coerce')
+    starting = now.floor("min") + pd.to_timedelta(minutes, unit='m')
+    return pd.Series(parsed).where(minutes.isna(), starting)
+
+
+def localize(naive, tz):
+    """
+    Attaches tz to naive times. Each time gets the offset in force on its own
+    date, so a batch spanning a DST change converts correctly. Times in the
+    repeated fall-back hour are taken as daylight time and times in the
+    skipped spring-forward hour are moved forward.
+    """
+    naive = pd.DatetimeIndex(naive)
+    return naive.tz_localize(tz, ambiguous=np.ones(len(naive), dtype=bool),
+                             nonexistent='shift_forward')
+
+
+def closest_year(values, format, now):
+    """
+    Parses dates that have no year into the year that puts them closest to
+    now, so a January game listed in December lands in the next year. Every
+    candidate year is tried before validating, so Feb 29 finds its leap year.
+    """
+    years = (now.year - 1, now.year, now.year + 1)
+    parsed = np.stack([
+        pd.to_datetime(f"{year} " + values, format="%Y " + format, errors='coerce')
+        .to_numpy(dtype="datetime64[ns]") for year in years])
+    distance = np.abs(parsed - np.datetime64(now.tz_localize(None).to_datetime64(), "ns"))
+    distance = np.where(np.isnat(parsed), np.timedelta64(np.iinfo(np.int64).max, "ns"), distance)
+    return parsed[distance.argmin(axis=0), np.arange(parsed.shape[1])]
+
+
+def reprocess_history(data_dir, column='date'):
+    """
+    Adds 'start_utc' to every stored odds file under data_dir, treating
+    column as naive local time
+    """
+    for root, _, files in os.walk(data_dir):
+        for name in files:
+            if not name.endswith(".csv"):
+                continue
+            path = os.path.join(root, name)
+            df = pd.read_csv(path, index_col=0)
+            if column not in df.columns and df.index.name != column:
+                continue
+            print(f"Normalizing {path}")
+            # Swapped in whole so a crash never leaves a partially rewritten file
+            tmp = path + ".tmp"
+            with open(tmp, 'w', newline='') as f:
+                normalize_frame(df, column, 'local').to_csv(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)